@@ -7,7 +7,7 @@ import logging
 import zipfile
 import openpyxl
 from openpyxl.styles import Font, Alignment
-from collections import defaultdict
+from collections import defaultdict, Counter
 from datetime import datetime
 from itertools import combinations
 import warnings
@@ -20,6 +20,55 @@ warnings.filterwarnings('ignore')
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('MultiAccountWashTrade')
 
+# Excel读取引擎：安装了python-calamine时使用更快的calamine引擎
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+# Excel导出引擎：安装了xlsxwriter时使用更快的xlsxwriter写出
+try:
+    import xlsxwriter
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = None
+
+# 数值内核JIT：安装了numba时编译账户组相似度筛选内核
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+# 导出数值列：Excel写入原始数值并设置单元格格式，CSV按显示格式转成文本
+# 列名 -> (Excel数字格式, 显示文本格式)
+EXPORT_VALUE_FORMATS = {
+    '总投注金额': ('"¥"#,##0.00', "¥{:,.2f}"),
+    '总金额': ('"¥"#,##0.00', "¥{:,.2f}"),
+    '平均相似度': ('0.00%', "{:.2%}"),
+    '相似度': ('0.00%', "{:.2%}")
+}
+
+# 逐行解析用到的正则预编译一次，避免每次调用都走re模块缓存查找
+_AMOUNT_PATTERNS = tuple(re.compile(pattern) for pattern in [
+    r'投注[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'下注[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'金额[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'总额[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'([-]?\d+[,，]?\d*\.?\d*)\s*元',
+    r'￥\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'¥\s*([-]?\d+[,，]?\d*\.?\d*)',
+    r'[\$￥¥]?\s*([-]?\d+[,，]?\d*\.?\d+)',
+    r'([-]?\d+[,，]?\d*\.?\d+)',
+])
+_NON_AMOUNT_CHAR_RE = re.compile(r'[^\d.]')
+_NON_SIGNED_AMOUNT_CHAR_RE = re.compile(r'[^\d.-]')
+_SHORT_NUMBER_RE = re.compile(r'\b\d{1,2}\b')
+_DIGITS_RE = re.compile(r'\d+')
+_WHITESPACE_RE = re.compile(r'\s+')
+_BRACKETS_RE = re.compile(r'[\(\)（）【】]')
+
 # Streamlit 页面配置
 st.set_page_config(
     page_title="智能对刷检测系统",
@@ -71,6 +120,12 @@ class Config:
         # 账户期数差异阈值
         self.account_period_diff_threshold = 101
         
+        # 两账户候选对数达到该值时用数组批量生成，小方向桶仍逐对枚举更快
+        self.vectorized_pair_min_count = 256
+        # 详细记录达到该行数时建议改用CSV导出；超过Excel单表行数上限时无法导出Excel
+        self.large_export_rows = 100000
+        self.excel_max_rows = 1048576
+        
         # 方向模式
         self.base_direction_patterns = {
             '小': ['两面-小', '和值-小', '小', 'small', 'xia', 'xiao', '和值小', '总和-小', '总和小', '和值_小', '总和_小'],
@@ -184,7 +239,19 @@ class Config:
         # 合并方向模式
         self.direction_patterns = {**self.base_direction_patterns, **self.enhanced_direction_patterns}
         
-        # 对立组配置
+        # 预编译方向匹配：精确匹配查表，部分匹配每个方向一条正则，避免逐条遍历关键词
+        self.direction_exact_lookup = {}
+        for direction, patterns in self.direction_patterns.items():
+            for pattern in patterns:
+                self.direction_exact_lookup.setdefault(pattern, []).append(direction)
+        
+        self.direction_regexes = {
+            direction: re.compile('|'.join(re.escape(pattern) for pattern in patterns))
+            for direction, patterns in self.direction_patterns.items()
+            if patterns
+        }
+        
+        # 对立组配置（frozenset元组，重复的对立组只保留一份）
         self.opposite_groups = [
             {'大', '小'}, {'单', '双'}, {'龙', '虎'}, {'质', '合'},
             {'特大', '特小'}, {'特单', '特双'}, 
@@ -213,6 +280,7 @@ class Config:
             {'特码两面-特大', '特码两面-特小'},
             {'特码两面-特单', '特码两面-特双'},
         ]
+        self.opposite_groups = tuple(dict.fromkeys(frozenset(group) for group in self.opposite_groups))
         
         # 位置关键词映射
         self.position_keywords = {
@@ -282,22 +350,45 @@ class DataProcessor:
         }
         
         self.similarity_threshold = 0.7
+        
+        # 候选列名预先标准化并拆成字符集合，识别时不再逐次重复处理
+        self.normalized_column_mapping = {
+            standard_col: [
+                (self.normalize_column_name(possible_name), set(self.normalize_column_name(possible_name)))
+                for possible_name in possible_names
+            ]
+            for standard_col, possible_names in self.column_mapping.items()
+        }
+        
+        # 标准化列名 -> 可精确对应的标准列集合，精确命中时跳过模糊比对
+        self.exact_column_lookup = defaultdict(set)
+        for standard_col, possible_names in self.normalized_column_mapping.items():
+            for possible_name_lower, _ in possible_names:
+                self.exact_column_lookup[possible_name_lower].add(standard_col)
+    
+    @staticmethod
+    def normalize_column_name(column_name):
+        """列名标准化：小写并去掉空格、下划线、连字符"""
+        return column_name.lower().replace(' ', '').replace('_', '').replace('-', '')
     
     def smart_column_identification(self, df_columns):
         """智能列识别"""
         identified_columns = {}
         actual_columns = [str(col).strip() for col in df_columns]
+        normalized_actual_columns = []
+        for actual_col in actual_columns:
+            actual_col_lower = self.normalize_column_name(actual_col)
+            normalized_actual_columns.append((actual_col, actual_col_lower, set(actual_col_lower)))
         
-        for standard_col, possible_names in self.column_mapping.items():
+        for standard_col, possible_names in self.normalized_column_mapping.items():
             found = False
-            for actual_col in actual_columns:
-                actual_col_lower = actual_col.lower().replace(' ', '').replace('_', '').replace('-', '')
+            for actual_col, actual_col_lower, set2 in normalized_actual_columns:
+                # 精确命中必然满足下面的包含条件，直接认定
+                if standard_col in self.exact_column_lookup.get(actual_col_lower, ()):
+                    identified_columns[actual_col] = standard_col
+                    break
                 
-                for possible_name in possible_names:
-                    possible_name_lower = possible_name.lower().replace(' ', '').replace('_', '').replace('-', '')
-                    
-                    set1 = set(possible_name_lower)
-                    set2 = set(actual_col_lower)
+                for possible_name_lower, set1 in possible_names:
                     intersection = set1 & set2
                     
                     similarity_score = len(intersection) / len(set1) if set1 else 0
@@ -348,14 +439,42 @@ class DataProcessor:
 
         return issues
     
+    def read_uploaded_table(self, uploaded_file, **kwargs):
+        """读取上传文件 - CSV走read_csv，Excel优先calamine引擎，不可用时回退默认引擎
+        
+        CSV固定使用默认C引擎：pyarrow引擎会先推断数值类型再转成文本，账号、期号的前导零和金额小数位会被改写。
+        """
+        if hasattr(uploaded_file, 'seek'):
+            uploaded_file.seek(0)
+        
+        filename = str(getattr(uploaded_file, 'name', uploaded_file))
+        
+        if filename.lower().endswith('.csv'):
+            try:
+                return pd.read_csv(uploaded_file, encoding='utf-8-sig', **kwargs)
+            except UnicodeDecodeError:
+                if hasattr(uploaded_file, 'seek'):
+                    uploaded_file.seek(0)
+                return pd.read_csv(uploaded_file, encoding='gbk', **kwargs)
+        
+        if EXCEL_READ_ENGINE == 'calamine':
+            try:
+                return pd.read_excel(uploaded_file, engine='calamine', **kwargs)
+            except (ImportError, ValueError) as e:
+                logger.warning(f"calamine引擎读取失败，回退默认引擎: {str(e)}")
+                if hasattr(uploaded_file, 'seek'):
+                    uploaded_file.seek(0)
+        
+        return pd.read_excel(uploaded_file, **kwargs)
+    
     def clean_data(self, uploaded_file):
         """数据清洗主函数"""
         try:
-            df_temp = pd.read_excel(uploaded_file, header=None, nrows=50)
+            df_temp = self.read_uploaded_table(uploaded_file, header=None, nrows=50)
             
             start_row, start_col = self.find_data_start(df_temp)
             
-            df_clean = pd.read_excel(
+            df_clean = self.read_uploaded_table(
                 uploaded_file, 
                 header=start_row,
                 skiprows=range(start_row + 1) if start_row > 0 else None,
@@ -835,18 +954,13 @@ class ContentParser:
             directions = set()
             
             # 5.1 精确匹配
-            for direction, patterns in config.direction_patterns.items():
-                for pattern in patterns:
-                    if pattern == content_clean:
-                        directions.add(direction)
-                        break
+            directions.update(config.direction_exact_lookup.get(content_clean, ()))
             
             # 5.2 部分匹配
             if not directions:
-                for direction, patterns in config.direction_patterns.items():
-                    for pattern in patterns:
-                        if pattern in content_clean:
-                            directions.add(direction)
+                for direction, regex in config.direction_regexes.items():
+                    if regex.search(content_clean):
+                        directions.add(direction)
             
             # 5.3 智能LHC位置提取
             if not directions:
@@ -876,7 +990,7 @@ class ContentParser:
                 return []
             
             content_str = str(content).strip()
-            numbers = re.findall(r'\b\d{1,2}\b', content_str)
+            numbers = _SHORT_NUMBER_RE.findall(content_str)
             
             valid_numbers = []
             for num in numbers:
@@ -963,29 +1077,22 @@ class ContentParser:
         content_str = content_str.replace('，', ',').replace('；', ';').replace('：', ':')
         
         # 压缩多余空格
-        content_str = re.sub(r'\s+', ' ', content_str).strip()
+        content_str = _WHITESPACE_RE.sub(' ', content_str).strip()
         
         # 移除括号
-        content_str = re.sub(r'[\(\)（）【】]', '', content_str)
+        content_str = _BRACKETS_RE.sub('', content_str)
         
         return content_str
 
     @staticmethod
     def multi_level_direction_extraction(content, config):
         """多层级方向提取"""
-        directions = set()
-        
-        for direction, patterns in config.direction_patterns.items():
-            for pattern in patterns:
-                if pattern == content:
-                    directions.add(direction)
-                    break
+        directions = set(config.direction_exact_lookup.get(content, ()))
         
         if not directions:
-            for direction, patterns in config.direction_patterns.items():
-                for pattern in patterns:
-                    if pattern in content:
-                        directions.add(direction)
+            for direction, regex in config.direction_regexes.items():
+                if regex.search(content):
+                    directions.add(direction)
         
         if not directions:
             directions = ContentParser.smart_lhc_position_extraction(content, config)
@@ -1413,7 +1520,7 @@ class PK10SequenceDetector:
         """检测序列覆盖模式"""
         sequence_patterns = []
         
-        period_groups = df_pk10.groupby('期号')
+        period_groups = df_pk10.groupby('期号', observed=True)
         
         for period, period_data in period_groups:
             position_account_content = defaultdict(lambda: defaultdict(list))
@@ -1613,7 +1720,7 @@ class PK10SequenceDetector:
                     if number_part.isdigit():
                         return number_part
             
-            numbers = re.findall(r'\d+', content_str)
+            numbers = _DIGITS_RE.findall(content_str)
             if numbers:
                 return numbers[0]
             
@@ -1658,6 +1765,30 @@ class PK10SequenceDetector:
         else:
             return str(content)
 
+# ==================== 数值内核 ====================
+def _screen_groups_kernel(group_amounts, same_side, similarity_threshold):
+    """逐组计算两方向金额相似度并与阈值比较，返回保留掩码
+    
+    每组按组内顺序逐列累加，与逐组求和的结果完全一致；安装numba时编译为机器码并按组并行。
+    """
+    n_groups, n_accounts = group_amounts.shape
+    keep = np.zeros(n_groups, dtype=np.bool_)
+    for group_idx in prange(n_groups):
+        dir1_total = 0.0
+        dir2_total = 0.0
+        for column in range(n_accounts):
+            if same_side[group_idx, column]:
+                dir1_total += group_amounts[group_idx, column]
+            else:
+                dir2_total += group_amounts[group_idx, column]
+        
+        if dir1_total > 0 and dir2_total > 0:
+            keep[group_idx] = min(dir1_total, dir2_total) / max(dir1_total, dir2_total) >= similarity_threshold
+    return keep
+
+# 未安装numba时为None，走NumPy向量化路径
+_screen_groups_jit = njit(cache=True, parallel=True)(_screen_groups_kernel) if njit is not None else None
+
 # ==================== 对刷检测器类 ====================
 class WashTradeDetector:
     def __init__(self, config=None):
@@ -1674,36 +1805,12 @@ class WashTradeDetector:
         
         self.account_total_periods_by_lottery = defaultdict(dict)
         self.account_record_stats_by_lottery = defaultdict(dict)
+        self.activity_level_cache = {}
+        self.opposite_partners = None
         self.performance_stats = {}
-
-    def filter_accounts_by_amount_balance(self, account_group, directions, amounts):
-        """根据组内金额平衡性过滤账户 - 确保正确过滤"""
-        if not self.config.amount_threshold['enable_threshold_filter']:
-            return account_group, directions, amounts
-        
-        if not amounts or len(amounts) < 2:
-            return account_group, directions, amounts
-        
-        # 计算最大最小金额比例
-        max_amount = max(amounts)
-        min_amount = min(amounts)
         
-        # 防止除零
-        if min_amount == 0:
-            return account_group, directions, amounts
-        
-        amount_ratio = max_amount / min_amount
-        
-        max_allowed_ratio = self.config.amount_threshold['max_amount_ratio']
-        
-        # 如果金额比例超过阈值，直接过滤掉这个组合
-        if amount_ratio > max_allowed_ratio:
-            logger.info(f"金额平衡过滤: 账户组 {account_group} 金额比例 {amount_ratio:.1f}倍 > 阈值 {max_allowed_ratio}倍，过滤")
-            logger.info(f"原始金额: {amounts}")
-            return [], [], []
-        
-        logger.info(f"金额平衡检查通过: 账户组 {account_group} 金额比例 {amount_ratio:.1f}倍 <= 阈值 {max_allowed_ratio}倍")
-        return account_group, directions, amounts
+        # 主流程设置的缓存键（文件摘要+检测参数），用于复用导出文件
+        self.report_key = None
 
     def upload_and_process(self, uploaded_file):
         """上传并处理文件"""
@@ -1738,30 +1845,26 @@ class WashTradeDetector:
         try:
             if '彩种' in df_clean.columns:
                 df_clean['原始彩种'] = df_clean['彩种']
-                df_clean['彩种类型'] = df_clean['彩种'].apply(self.lottery_identifier.identify_lottery_type)
+                df_clean['彩种类型'] = self._map_unique_values(df_clean['彩种'], self.lottery_identifier.identify_lottery_type)
             
             if '玩法' in df_clean.columns:
-                df_clean['玩法分类'] = df_clean['玩法'].apply(self.play_normalizer.normalize_category)
+                df_clean['玩法分类'] = self._map_unique_values(df_clean['玩法'], self.play_normalizer.normalize_category)
             else:
                 df_clean['玩法分类'] = ''
             
-            df_clean['投注金额'] = df_clean['金额'].apply(
-                lambda x: self.extract_bet_amount_safe(str(x))
-            )
+            df_clean['投注金额'] = self.extract_bet_amounts(df_clean['金额'])
             
-            df_clean['投注方向'] = df_clean.apply(
-                lambda row: self.enhanced_extract_direction_with_position(
-                    row['内容'], 
-                    row.get('玩法分类', ''), 
-                    row.get('彩种类型', '未知')
-                ), 
-                axis=1
-            )
+            df_clean['投注方向'] = self.extract_bet_directions(df_clean)
             
             df_valid = df_clean[
                 (df_clean['投注方向'] != '') & 
                 (df_clean['投注金额'] >= self.config.min_amount)
-            ].copy()
+            ]
+            
+            # 分组键列和低基数标签列转为category，后续groupby/nunique/比较直接使用整数编码
+            # 布尔筛选已生成新表，astype一次完成转换，无需先整表copy
+            category_columns = ['会员账号', '期号', '彩种', '原始彩种', '彩种类型', '玩法分类']
+            df_valid = df_valid.astype({col: 'category' for col in category_columns if col in df_valid.columns})
             
             self.data_processed = True
             self.df_valid = df_valid
@@ -1775,6 +1878,32 @@ class WashTradeDetector:
             st.error(f"数据处理增强失败: {str(e)}")
             return pd.DataFrame()
 
+    @staticmethod
+    def _map_unique_values(series, func):
+        """按唯一值调用func再按编码映射回整列，重复值不再逐行解析"""
+        codes, uniques = pd.factorize(series, use_na_sentinel=False)
+        mapped = np.array([func(value) for value in uniques], dtype=object)
+        return pd.Series(mapped[codes], index=series.index)
+    
+    def extract_bet_amounts(self, amount_series):
+        """批量提取投注金额 - 只解析唯一金额文本再按编码映射回整列；纯数字向量化转换，其余格式逐个解析"""
+        codes, uniques = pd.factorize(amount_series, use_na_sentinel=False)
+        amount_text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+        amounts = pd.Series(0.0, index=amount_text.index)
+
+        # 纯数字金额直接整列转换，与逐行解析结果一致
+        plain_mask = amount_text.str.fullmatch(r'-?\d+(?:\.\d+)?').astype(bool)
+        if plain_mask.any():
+            plain_amounts = amount_text[plain_mask].astype(float)
+            amounts[plain_mask] = plain_amounts.where(plain_amounts >= self.config.min_amount, 0.0)
+
+        # 其他格式（投注：xx抵用：xx、带单位、科学计数法等）规则有先后顺序和阈值回退，逐个解析
+        other_mask = ~plain_mask
+        if other_mask.any():
+            amounts[other_mask] = amount_text[other_mask].apply(self.extract_bet_amount_safe).astype(float)
+
+        return pd.Series(amounts.to_numpy()[codes], index=amount_series.index)
+
     def extract_bet_amount_safe(self, amount_text):
         """安全提取投注金额"""
         try:
@@ -1797,7 +1926,7 @@ class WashTradeDetector:
             if text.startswith('投注：'):
                 try:
                     bet_part = text.replace('投注：', '').strip()
-                    bet_part_clean = re.split(r'[^\d.]', bet_part)[0]
+                    bet_part_clean = _NON_AMOUNT_CHAR_RE.split(bet_part)[0]
                     amount = float(bet_part_clean)
                     if amount >= self.config.min_amount:
                         return amount
@@ -1825,7 +1954,7 @@ class WashTradeDetector:
             
             # 尝试提取纯数字
             try:
-                cleaned_text = re.sub(r'[^\d.-]', '', text)
+                cleaned_text = _NON_SIGNED_AMOUNT_CHAR_RE.sub('', text)
                 if cleaned_text and cleaned_text != '-':
                     amount = float(cleaned_text)
                     if amount >= self.config.min_amount:
@@ -1834,20 +1963,8 @@ class WashTradeDetector:
                 pass
             
             # 使用正则表达式模式匹配
-            patterns = [
-                r'投注[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'下注[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'金额[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'总额[:：]?\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'([-]?\d+[,，]?\d*\.?\d*)\s*元',
-                r'￥\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'¥\s*([-]?\d+[,，]?\d*\.?\d*)',
-                r'[\$￥¥]?\s*([-]?\d+[,，]?\d*\.?\d+)',
-                r'([-]?\d+[,，]?\d*\.?\d+)',
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, text)
+            for pattern in _AMOUNT_PATTERNS:
+                match = pattern.search(text)
                 if match:
                     amount_str = match.group(1).replace(',', '').replace('，', '').replace(' ', '')
                     try:
@@ -1862,6 +1979,27 @@ class WashTradeDetector:
         except Exception:
             return 0
     
+    def extract_bet_directions(self, df):
+        """批量提取投注方向 - 相同(内容, 是否PK10)只解析一次，再整列映射回去
+        
+        方向解析只区分彩种类型是否为PK10，与玩法分类无关，按这两项去重即可。
+        """
+        lottery_types = df['彩种类型'] if '彩种类型' in df.columns else pd.Series('未知', index=df.index)
+        keys = pd.DataFrame({
+            '内容': df['内容'],
+            '是否PK10': (lottery_types == 'PK10').to_numpy()
+        }, index=df.index)
+
+        group_ids = keys.groupby(['内容', '是否PK10'], sort=False, dropna=False).ngroup().to_numpy()
+        unique_keys = keys.drop_duplicates()
+
+        unique_directions = np.array([
+            self.enhanced_extract_direction_with_position(content, '', 'PK10' if is_pk10 else '')
+            for content, is_pk10 in unique_keys.itertuples(index=False)
+        ], dtype=object)
+
+        return pd.Series(unique_directions[group_ids], index=df.index, dtype=object)
+
     def enhanced_extract_direction_with_position(self, content, play_category, lottery_type):
         """全面修复方向提取 - 支持所有格式"""
         try:
@@ -1879,7 +2017,7 @@ class WashTradeDetector:
                     if len(parts) >= 2:
                         number_part = parts[1].strip()
                         # 提取所有数字
-                        numbers = re.findall(r'\b\d{1,2}\b', number_part)
+                        numbers = _SHORT_NUMBER_RE.findall(number_part)
                         if numbers:
                             unique_numbers = sorted(set(numbers))
                             if len(unique_numbers) > 1:
@@ -1898,7 +2036,7 @@ class WashTradeDetector:
                             return directions[0]  # 取第一个方向
             
             # 通用数字提取
-            numbers = re.findall(r'\b\d{1,2}\b', content_str)
+            numbers = _SHORT_NUMBER_RE.findall(content_str)
             if numbers:
                 unique_numbers = sorted(set(numbers))
                 if len(unique_numbers) > 1:
@@ -1971,19 +2109,22 @@ class WashTradeDetector:
         """修复账户期数统计方法"""
         self.account_total_periods_by_lottery = defaultdict(dict)
         self.account_record_stats_by_lottery = defaultdict(dict)
+        self.activity_level_cache = {}
         
         data_source = self.df_valid if hasattr(self, 'df_valid') and self.df_valid is not None else df
         
         lottery_col = '彩种'
         
-        for lottery in data_source[lottery_col].unique():
-            df_lottery = data_source[data_source[lottery_col] == lottery]
-            
-            period_counts = df_lottery.groupby('会员账号')['期号'].nunique().to_dict()
-            self.account_total_periods_by_lottery[lottery] = period_counts
-            
-            record_counts = df_lottery.groupby('会员账号').size().to_dict()
-            self.account_record_stats_by_lottery[lottery] = record_counts
+        # 一次分组同时得到所有彩种下各账户的期数与记录数，不再逐彩种过滤
+        lottery_account_groups = data_source.groupby([lottery_col, '会员账号'], observed=True)
+        period_counts = lottery_account_groups['期号'].nunique().to_dict()
+        record_counts = lottery_account_groups.size().to_dict()
+        
+        for (lottery, account), periods in period_counts.items():
+            self.account_total_periods_by_lottery[lottery][account] = periods
+        
+        for (lottery, account), records in record_counts.items():
+            self.account_record_stats_by_lottery[lottery][account] = records
     
     def detect_all_wash_trades(self):
         """修复的主检测方法"""
@@ -1991,6 +2132,10 @@ class WashTradeDetector:
             st.error("❌ 没有有效数据可用于检测")
             return []
         
+        # 活跃度阈值与对立组可能在两次检测之间被调整
+        self.activity_level_cache = {}
+        self.opposite_partners = None
+        
         df_filtered = self.exclude_multi_direction_accounts(self.df_valid)
         
         if len(df_filtered) == 0:
@@ -2003,9 +2148,12 @@ class WashTradeDetector:
         all_patterns = []
         total_steps = self.config.max_accounts_in_group + 1
         
+        # 期号切分与账户统计只做一次，各N值共用
+        period_index = self.build_period_index(df_filtered)
+        
         for account_count in range(2, self.config.max_accounts_in_group + 1):
             status_text.text(f"🔍 检测{account_count}个账户对刷模式...")
-            patterns = self.detect_n_account_patterns_optimized(df_filtered, account_count)
+            patterns = self.detect_n_account_patterns_optimized(df_filtered, account_count, period_index)
             all_patterns.extend(patterns)
             
             progress = (account_count - 1) / total_steps
@@ -2020,34 +2168,101 @@ class WashTradeDetector:
         
         return all_patterns
     
-    def detect_n_account_patterns_optimized(self, df_filtered, n_accounts):
+    def build_period_index(self, df_filtered):
+        """按(期号, 原始彩种)切分行位置并预先统计各期号账户，供各N值检测复用
+        
+        整表一次性转为列数组，各期号按行位置切片，不再逐期构造子DataFrame。
+        """
+        account_codes, _ = pd.factorize(df_filtered['会员账号'], use_na_sentinel=False)
+        bet_columns = {
+            column: df_filtered[column].to_numpy()
+            for column in ['会员账号', '投注方向', '投注金额', '期号', '原始彩种', '彩种类型', '彩种']
+            if column in df_filtered.columns
+        }
+        
+        period_slices = []
+        period_indices = df_filtered.groupby(['期号', '原始彩种'], observed=True).indices
+        for positions in period_indices.values():
+            _, first_positions = np.unique(account_codes[positions], return_index=True)
+            # 账户按首次出现顺序排列
+            period_slices.append((positions, np.sort(first_positions)))
+        
+        return bet_columns, period_slices
+    
+    def detect_n_account_patterns_optimized(self, df_filtered, n_accounts, period_index=None):
         """N个账户对刷模式检测"""
         wash_records = []
         
-        period_groups = df_filtered.groupby(['期号', '原始彩种'])
+        if period_index is None:
+            period_index = self.build_period_index(df_filtered)
+        bet_columns, period_slices = period_index
         
         valid_direction_combinations = self._get_valid_direction_combinations(n_accounts)
         
-        batch_size = 100
-        period_keys = list(period_groups.groups.keys())
+        # 按排序后的方向组合建立索引，相同方向组合只保留第一个
+        combinations_by_directions = {}
+        for combo in valid_direction_combinations:
+            combinations_by_directions.setdefault(tuple(sorted(combo['directions'])), combo)
         
-        for i in range(0, len(period_keys), batch_size):
-            batch_keys = period_keys[i:i+batch_size]
+        # 模式描述只取决于方向组合，建表时生成一次，不再逐条记录拆分字符串
+        for combo in combinations_by_directions.values():
+            combo['pattern'] = self._format_combination_pattern(combo)
+        
+        # 不存在足够对立方向账户的期号直接跳过
+        viable_periods = self._find_periods_with_opposite_accounts(bet_columns, period_slices, n_accounts)
+        for (positions, first_positions), viable in zip(period_slices, viable_periods):
+            if not viable:
+                continue
             
-            for period_key in batch_keys:
-                period_data = period_groups.get_group(period_key)
-                period_accounts = period_data['会员账号'].unique()
-                
-                if len(period_accounts) < n_accounts:
-                    continue
-                
-                batch_patterns = self._detect_combinations_for_period(
-                    period_data, period_accounts, n_accounts, valid_direction_combinations
-                )
-                wash_records.extend(batch_patterns)
+            period_bets = {column: values[positions] for column, values in bet_columns.items()}
+            period_accounts = period_bets['会员账号'][first_positions]
+            
+            batch_patterns = self._detect_combinations_for_period(
+                period_bets, period_accounts, n_accounts, combinations_by_directions
+            )
+            wash_records.extend(batch_patterns)
         
         return self.find_continuous_patterns_optimized(wash_records)
-
+    
+    def _find_periods_with_opposite_accounts(self, bet_columns, period_slices, n_accounts):
+        """向量化预筛期号：某对对立方向两边都有账户、且两边账户数合计不少于N时，该期号才可能产生组合
+        
+        账户方向取其在该期的首条记录，与逐期检测时的取法一致。
+        """
+        if not period_slices:
+            return np.zeros(0, dtype=bool)
+        
+        first_rows = np.concatenate([positions[first_positions] for positions, first_positions in period_slices])
+        period_ids = np.repeat(
+            np.arange(len(period_slices)),
+            [len(first_positions) for _, first_positions in period_slices]
+        )
+        direction_codes, directions = pd.factorize(bet_columns['投注方向'][first_rows])
+        
+        # 每期各方向的账户数
+        known = direction_codes >= 0
+        n_directions = max(len(directions), 1)
+        direction_counts = np.bincount(
+            period_ids[known] * n_directions + direction_codes[known],
+            minlength=len(period_slices) * n_directions
+        ).reshape(len(period_slices), n_directions)
+        
+        direction_lookup = {direction: index for index, direction in enumerate(directions)}
+        viable = np.zeros(len(period_slices), dtype=bool)
+        for opposites in self.config.opposite_groups:
+            if len(opposites) != 2:
+                continue
+            
+            dir1, dir2 = opposites
+            if dir1 not in direction_lookup or dir2 not in direction_lookup:
+                continue
+            
+            dir1_counts = direction_counts[:, direction_lookup[dir1]]
+            dir2_counts = direction_counts[:, direction_lookup[dir2]]
+            viable |= (dir1_counts > 0) & (dir2_counts > 0) & (dir1_counts + dir2_counts >= n_accounts)
+        
+        return viable
+    
     def detect_pk10_sequence_patterns(self, df_filtered):
         """PK10序列位置模式检测 - 保持所有检测逻辑"""
         try:
@@ -2055,18 +2270,28 @@ class WashTradeDetector:
                 df_pk10 = self.df_valid[
                     (self.df_valid['彩种类型'] == 'PK10') & 
                     (self.df_valid['投注金额'] >= self.config.min_amount)
-                ].copy()
+                ]
             else:
                 df_pk10 = df_filtered[
                     (df_filtered['彩种类型'] == 'PK10') & 
                     (df_filtered['投注金额'] >= self.config.min_amount)
-                ].copy()
+                ]
             
             if len(df_pk10) == 0:
                 return []
             
+            # 只保留各检测方法用到的列，文本列统一转为object：逐期切片、比较和tolist
+            # 不再经过Categorical/字符串扩展数组，每期的开销只剩普通ndarray取行
+            pk10_columns = [
+                column for column in ['期号', '会员账号', '彩种', '原始彩种', '玩法', '玩法分类', '内容', '投注金额', '投注方向']
+                if column in df_pk10.columns
+            ]
+            df_pk10 = df_pk10[pk10_columns].astype({
+                column: object for column in pk10_columns if column not in ('期号', '投注金额')
+            })
+            
             sequence_patterns = []
-            period_groups = df_pk10.groupby('期号')
+            period_groups = df_pk10.groupby('期号', observed=True)
             
             for period, period_data in period_groups:
                 if len(period_data) > 0:
@@ -2100,6 +2325,23 @@ class WashTradeDetector:
             logger.error(f"PK10序列检测失败: {str(e)}")
             return []
     
+    def _format_combination_pattern(self, combo):
+        """方向组合的模式描述，如 大(2个) vs 小(1个)"""
+        if ' vs ' in combo['opposite_type']:
+            pattern_parts = combo['opposite_type'].split(' vs ')
+            if len(pattern_parts) == 2:
+                dir1_part = pattern_parts[0].split('-')
+                dir2_part = pattern_parts[1].split('-')
+                if len(dir1_part) == 2 and len(dir2_part) == 2:
+                    return f"{dir1_part[0]}-{dir1_part[1]}({combo['dir1_count']}个) vs {dir2_part[0]}-{dir2_part[1]}({combo['dir2_count']}个)"
+                return f"{pattern_parts[0]}({combo['dir1_count']}个) vs {pattern_parts[1]}({combo['dir2_count']}个)"
+            return combo['opposite_type']
+        
+        opposite_parts = combo['opposite_type'].split('-')
+        if len(opposite_parts) == 2:
+            return f"{opposite_parts[0]}({combo['dir1_count']}个) vs {opposite_parts[1]}({combo['dir2_count']}个)"
+        return combo['opposite_type']
+    
     def _get_valid_direction_combinations(self, n_accounts):
         """有效方向组合生成"""
         valid_combinations = []
@@ -2147,219 +2389,323 @@ class WashTradeDetector:
         
         return valid_combinations
     
-    def _detect_combinations_for_period(self, period_data, period_accounts, n_accounts, valid_combinations):
-        """为单个期号检测组合"""
+    def _detect_combinations_for_period(self, period_bets, period_accounts, n_accounts, combinations_by_directions):
+        """为单个期号检测组合 - period_bets 为该期号各列的数组切片，combinations_by_directions 以排序后的方向组合为键"""
         patterns = []
-        detected_combinations = set()
         
         # 确保lottery_type有默认值
         lottery_type = '未知'
         
         # 尝试从不同列获取彩种类型
-        if len(period_data) > 0:
-            if '彩种类型' in period_data.columns:
-                lottery_type = period_data['彩种类型'].iloc[0]
-            elif '原始彩种' in period_data.columns:
+        if len(period_bets['会员账号']) > 0:
+            if '彩种类型' in period_bets:
+                lottery_type = period_bets['彩种类型'][0]
+            elif '原始彩种' in period_bets:
                 # 从原始彩种推断类型
-                lottery_name = period_data['原始彩种'].iloc[0]
+                lottery_name = period_bets['原始彩种'][0]
                 lottery_type = self.lottery_identifier.identify_lottery_type(lottery_name)
-            elif '彩种' in period_data.columns:
-                lottery_name = period_data['彩种'].iloc[0]
+            elif '彩种' in period_bets:
+                lottery_name = period_bets['彩种'][0]
                 lottery_type = self.lottery_identifier.identify_lottery_type(lottery_name)
         
-        lottery = period_data['原始彩种'].iloc[0] if '原始彩种' in period_data.columns else period_data['彩种'].iloc[0]
+        lottery = period_bets['原始彩种'][0] if '原始彩种' in period_bets else period_bets['彩种'][0]
         
-        current_period = period_data['期号'].iloc[0]
+        current_period = period_bets['期号'][0]
         
         # 修复点：同一账户同一方向的多笔投注金额合并
         # 使用嵌套的defaultdict来合并同一账户同一方向的金额
         account_direction_amounts = defaultdict(lambda: defaultdict(float))
         
-        for _, row in period_data.iterrows():
-            account = row['会员账号']
-            direction = row['投注方向']
-            amount = row['投注金额']
-            
+        for account, direction, amount in zip(
+            period_bets['会员账号'].tolist(),
+            period_bets['投注方向'].tolist(),
+            period_bets['投注金额'].tolist()
+        ):
             if direction:  # 只处理有方向的记录
                 # 累加同一账户同一方向的金额
                 account_direction_amounts[account][direction] += amount
         
-        # 将合并后的数据转换回原来的数据结构格式
+        # 每期只建一次 账户 -> (方向, 金额) 索引，候选组内直接查表
         account_info = {}
         for account, direction_amounts in account_direction_amounts.items():
             # 每个账户可能有多个方向，但我们只取一个（因为已过滤多方向账户）
             if direction_amounts:
                 # 取第一个方向（因为我们过滤了多方向账户）
-                direction = list(direction_amounts.keys())[0]
-                total_amount = direction_amounts[direction]
-                account_info[account] = [{
-                    'direction': direction,
-                    'amount': total_amount
-                }]
+                direction = next(iter(direction_amounts))
+                account_info[account] = (direction, direction_amounts[direction])
         
-        for account_group in combinations(period_accounts, n_accounts):
-            if not self._check_account_period_difference(account_group, lottery):
-                continue
-            
-            group_directions = []
-            group_amounts = []
-            
-            for account in account_group:
-                if account in account_info and account_info[account]:
-                    first_bet = account_info[account][0]
-                    group_directions.append(first_bet['direction'])
-                    group_amounts.append(first_bet['amount'])
-            
-            if len(group_directions) != n_accounts:
-                continue
-            
-            filtered_account_group, filtered_directions, filtered_amounts = self.filter_accounts_by_amount_balance(
-                account_group, group_directions, group_amounts
-            )
-            
-            if len(filtered_account_group) < 2:
-                continue
+        group_positions = self._generate_opposite_account_groups(period_accounts, account_info, n_accounts)
+        group_positions = self._screen_account_groups_by_similarity(
+            group_positions, period_accounts, account_info, n_accounts
+        )
+        group_positions = self._screen_account_groups_by_period_difference(group_positions, period_accounts, lottery)
+        
+        for positions in group_positions:
+            account_group = tuple(period_accounts[index] for index in positions)
             
-            account_group = filtered_account_group
-            group_directions = filtered_directions
-            group_amounts = filtered_amounts
-            n_accounts = len(account_group)
-
-            combination_key = (
-                tuple(sorted(account_group)), 
-                tuple(sorted(group_directions)),
-                tuple(sorted(group_amounts))
-            )
+            entries = [account_info[account] for account in account_group]
+            group_directions = [direction for direction, _ in entries]
+            group_amounts = [amount for _, amount in entries]
             
-            if combination_key in detected_combinations:
-                continue
+            # 候选组是去重后的账户位置元组，同一期内账户组不会重复，无需再按排序后的账户名/方向/金额去重
+            sorted_directions = tuple(sorted(group_directions))
             
-            for combo in valid_combinations:
-                target_directions = combo['directions']
+            # 同一方向组合最多对应一个有效组合，直接查表
+            combo = combinations_by_directions.get(sorted_directions)
+            if combo is not None:
+                dir1_total = 0
+                dir2_total = 0
+                dir1 = combo['directions'][0]
                 
-                actual_directions_sorted = sorted(group_directions)
-                target_directions_sorted = sorted(target_directions)
+                for direction, amount in zip(group_directions, group_amounts):
+                    if direction == dir1:
+                        dir1_total += amount
+                    else:
+                        dir2_total += amount
                 
-                if actual_directions_sorted == target_directions_sorted:
-                    detected_combinations.add(combination_key)
-                    
-                    dir1_total = 0
-                    dir2_total = 0
-                    dir1 = combo['directions'][0]
-                    
-                    for direction, amount in zip(group_directions, group_amounts):
-                        if direction == dir1:
-                            dir1_total += amount
-                        else:
-                            dir2_total += amount
-                    
-                    similarity_threshold = self.config.account_count_similarity_thresholds.get(
-                        n_accounts, self.config.amount_similarity_threshold
-                    )
+                similarity_threshold = self.config.account_count_similarity_thresholds.get(
+                    n_accounts, self.config.amount_similarity_threshold
+                )
+                
+                if dir1_total > 0 and dir2_total > 0:
+                    similarity = min(dir1_total, dir2_total) / max(dir1_total, dir2_total)
                     
-                    if dir1_total > 0 and dir2_total > 0:
-                        similarity = min(dir1_total, dir2_total) / max(dir1_total, dir2_total)
+                    if similarity >= similarity_threshold:
+                        record = {
+                            '期号': current_period,
+                            '彩种': lottery,
+                            '彩种类型': lottery_type,
+                            '账户组': list(account_group),
+                            '方向组': group_directions,
+                            '金额组': group_amounts,
+                            '总金额': dir1_total + dir2_total,
+                            '相似度': similarity,
+                            '账户数量': n_accounts,
+                            '模式': combo['pattern'],
+                            '对立类型': combo['opposite_type']
+                        }
                         
-                        if similarity >= similarity_threshold:
-                            # 使用已经定义好的lottery_type
-                            if ' vs ' in combo['opposite_type']:
-                                pattern_parts = combo['opposite_type'].split(' vs ')
-                                if len(pattern_parts) == 2:
-                                    dir1_part = pattern_parts[0].split('-')
-                                    dir2_part = pattern_parts[1].split('-')
-                                    if len(dir1_part) == 2 and len(dir2_part) == 2:
-                                        pattern_str = f"{dir1_part[0]}-{dir1_part[1]}({combo['dir1_count']}个) vs {dir2_part[0]}-{dir2_part[1]}({combo['dir2_count']}个)"
-                                    else:
-                                        pattern_str = f"{pattern_parts[0]}({combo['dir1_count']}个) vs {pattern_parts[1]}({combo['dir2_count']}个)"
-                                else:
-                                    pattern_str = combo['opposite_type']
-                            else:
-                                opposite_parts = combo['opposite_type'].split('-')
-                                if len(opposite_parts) == 2:
-                                    pattern_str = f"{opposite_parts[0]}({combo['dir1_count']}个) vs {opposite_parts[1]}({combo['dir2_count']}个)"
-                                else:
-                                    pattern_str = combo['opposite_type']
-                            
-                            record = {
-                                '期号': period_data['期号'].iloc[0],
-                                '彩种': lottery,
-                                '彩种类型': lottery_type,
-                                '账户组': list(account_group),
-                                '方向组': group_directions,
-                                '金额组': group_amounts,
-                                '总金额': dir1_total + dir2_total,
-                                '相似度': similarity,
-                                '账户数量': n_accounts,
-                                '模式': pattern_str,
-                                '对立类型': combo['opposite_type']
-                            }
-                            
-                            patterns.append(record)
-                            break
+                        patterns.append(record)
         
         return patterns
     
-    def _check_account_period_difference(self, account_group, lottery):
-        """检查账户组内账户的总投注期数差异是否在阈值内"""
-        if lottery not in self.account_total_periods_by_lottery:
-            return True
+    def _generate_opposite_account_groups(self, period_accounts, account_info, n_accounts):
+        """生成候选账户组 - 只组合方向恰好构成一对对立方向的账户
+        
+        按方向分桶后只枚举 C(大, i) × C(小, n-i)，不再遍历 C(全部账户, n)；
+        结果按原 combinations 的顺序返回，保证检测结果顺序不变。
+        多数字组合的反方向金额恒为0，不会产生记录，无需枚举。
+        若某种 i/n-i 拆分下两方向金额和的可达范围已不可能满足相似度阈值，整批跳过。
+        两账户时候选组即两方向账户的笛卡尔积，直接用数组生成，不经Python逐组枚举；
+        相似度即两笔金额之比，对方金额排序后二分查找，只生成金额落在 [a·t, a/t] 区间内的账户对。
+        """
+        direction_accounts = defaultdict(list)
+        direction_amounts = defaultdict(list)
+        for index, account in enumerate(period_accounts):
+            if account in account_info:
+                direction, amount = account_info[account]
+                direction_accounts[direction].append(index)
+                direction_amounts[direction].append(amount)
+        
+        similarity_threshold = self.config.account_count_similarity_thresholds.get(
+            n_accounts, self.config.amount_similarity_threshold
+        )
+        # 留出浮点累加误差的余量，边界情况交给后续逐组精确校验
+        bound_threshold = similarity_threshold * (1 - 1e-9)
+        
+        # 只遍历本期实际出现的方向及其对立方向，候选组最终排序，遍历顺序不影响结果
+        opposite_partners = self._get_opposite_partners()
+        opposite_pairs = [
+            (dir1, dir2)
+            for dir1 in direction_accounts
+            for dir2 in opposite_partners.get(dir1, ())
+            if dir2 in direction_accounts
+        ]
         
-        total_periods_stats = self.account_total_periods_by_lottery[lottery]
+        candidate_groups = set()
+        pair_blocks = []
+        for dir1, dir2 in opposite_pairs:
+            dir1_positions = direction_accounts[dir1]
+            dir2_positions = direction_accounts[dir2]
+            
+            dir1_sorted = sorted(direction_amounts[dir1])
+            dir2_sorted = sorted(direction_amounts[dir2])
+            
+            for i in range(max(1, n_accounts - len(dir2_positions)), min(len(dir1_positions), n_accounts - 1) + 1):
+                # 一方最大可能金额和仍不及另一方最小金额和的阈值比例时，该拆分下任何组合都不达标
+                dir1_min, dir1_max = sum(dir1_sorted[:i]), sum(dir1_sorted[-i:])
+                dir2_min, dir2_max = sum(dir2_sorted[:n_accounts - i]), sum(dir2_sorted[i - n_accounts:])
+                if dir1_max < bound_threshold * dir2_min or dir2_max < bound_threshold * dir1_min:
+                    continue
+                
+                if n_accounts == 2 and len(dir1_positions) * len(dir2_positions) >= self.config.vectorized_pair_min_count:
+                    dir1_array = np.asarray(dir1_positions, dtype=np.intp)
+                    dir1_amounts = np.asarray(direction_amounts[dir1], dtype=np.float64)
+                    dir2_order = np.argsort(direction_amounts[dir2], kind='stable')
+                    dir2_array = np.asarray(dir2_positions, dtype=np.intp)[dir2_order]
+                    dir2_amounts = np.asarray(direction_amounts[dir2], dtype=np.float64)[dir2_order]
+                    
+                    if bound_threshold > 0:
+                        band_starts = np.searchsorted(dir2_amounts, dir1_amounts * bound_threshold, side='left')
+                        band_ends = np.searchsorted(dir2_amounts, dir1_amounts / bound_threshold, side='right')
+                    else:
+                        band_starts = np.zeros(len(dir1_array), dtype=np.intp)
+                        band_ends = np.full(len(dir1_array), len(dir2_array), dtype=np.intp)
+                    band_sizes = np.maximum(band_ends - band_starts, 0)
+                    
+                    # 每个dir1账户与其金额区间内的dir2账户逐一配对
+                    first = np.repeat(dir1_array, band_sizes)
+                    offsets = np.arange(band_sizes.sum()) - np.repeat(np.cumsum(band_sizes) - band_sizes, band_sizes)
+                    second = dir2_array[np.repeat(band_starts, band_sizes) + offsets]
+                    
+                    # 账户对编码为 小位置*账户数+大位置，一维排序去重即为按元组字典序
+                    pair_blocks.append(np.minimum(first, second) * len(period_accounts) + np.maximum(first, second))
+                    continue
+                
+                for dir1_group in combinations(dir1_positions, i):
+                    for dir2_group in combinations(dir2_positions, n_accounts - i):
+                        candidate_groups.add(tuple(sorted(dir1_group + dir2_group)))
+        
+        if pair_blocks:
+            if candidate_groups:
+                pair_blocks.append(np.array(
+                    [first * len(period_accounts) + second for first, second in candidate_groups], dtype=np.intp
+                ))
+            # np.unique 去重并排序，与 sorted(set) 的顺序一致
+            pair_codes = np.unique(np.concatenate(pair_blocks))
+            return np.column_stack(np.divmod(pair_codes, len(period_accounts)))
+        
+        return np.array(sorted(candidate_groups), dtype=np.intp).reshape(-1, n_accounts)
+    
+    def _get_opposite_partners(self):
+        """对立方向索引：方向 -> 与其构成对立组的方向，每次检测只建一次"""
+        if self.opposite_partners is None:
+            opposite_partners = defaultdict(list)
+            for opposites in self.config.opposite_groups:
+                if len(opposites) != 2:
+                    continue
+                
+                dir1, dir2 = opposites
+                opposite_partners[dir1].append(dir2)
+            self.opposite_partners = dict(opposite_partners)
         
-        account_periods = []
-        for account in account_group:
-            if account in total_periods_stats:
-                account_periods.append(total_periods_stats[account])
-            else:
-                return True
+        return self.opposite_partners
+    
+    def _screen_account_groups_by_similarity(self, group_positions, period_accounts, account_info, n_accounts):
+        """批量计算候选账户组的金额平衡与两方向金额相似度，只保留可能达到阈值的组
+        
+        金额平衡过滤：组内最大/最小金额之比超过阈值的组整组剔除（最小金额为0时不过滤）；
+        相似度 min/max 与哪一方作为 dir1 无关，可在逐组校验前整批计算；
+        金额按组内顺序逐列累加，与逐组求和的结果完全一致。
+        """
+        if len(group_positions) == 0:
+            return group_positions
+        
+        account_amounts = np.zeros(len(period_accounts), dtype=np.float64)
+        direction_codes = np.full(len(period_accounts), -1, dtype=np.intp)
+        direction_index = {}
+        for index, account in enumerate(period_accounts):
+            if account in account_info:
+                direction, amount = account_info[account]
+                account_amounts[index] = amount
+                direction_codes[index] = direction_index.setdefault(direction, len(direction_index))
+        
+        group_amounts = account_amounts[group_positions]
+        
+        amount_threshold = self.config.amount_threshold
+        if amount_threshold['enable_threshold_filter']:
+            max_amounts = group_amounts.max(axis=1)
+            min_amounts = group_amounts.min(axis=1)
+            nonzero = min_amounts != 0
+            amount_ratios = np.divide(max_amounts, min_amounts, out=np.zeros_like(max_amounts), where=nonzero)
+            balanced = amount_ratios <= amount_threshold['max_amount_ratio']
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"金额平衡过滤: {len(group_positions)}个候选组中剔除{int((~balanced).sum())}个")
+            
+            group_positions = group_positions[balanced]
+            group_amounts = group_amounts[balanced]
+            if len(group_positions) == 0:
+                return group_positions
+        
+        same_side = direction_codes[group_positions] == direction_codes[group_positions[:, :1]]
+        
+        similarity_threshold = self.config.account_count_similarity_thresholds.get(
+            n_accounts, self.config.amount_similarity_threshold
+        )
         
-        if len(account_periods) < 2:
-            return True
+        if _screen_groups_jit is not None:
+            return group_positions[_screen_groups_jit(group_amounts, same_side, similarity_threshold)]
         
-        max_period = max(account_periods)
-        min_period = min(account_periods)
-        period_diff = max_period - min_period
+        dir1_totals = np.zeros(len(group_positions), dtype=np.float64)
+        dir2_totals = np.zeros(len(group_positions), dtype=np.float64)
+        for column in range(n_accounts):
+            dir1_totals += np.where(same_side[:, column], group_amounts[:, column], 0.0)
+            dir2_totals += np.where(same_side[:, column], 0.0, group_amounts[:, column])
         
-        if period_diff > self.config.account_period_diff_threshold:
-            return False
+        valid = (dir1_totals > 0) & (dir2_totals > 0)
+        similarities = np.full(len(group_positions), -1.0)
+        similarities[valid] = np.minimum(dir1_totals, dir2_totals)[valid] / np.maximum(dir1_totals, dir2_totals)[valid]
+        return group_positions[similarities >= similarity_threshold]
+    
+    def _screen_account_groups_by_period_difference(self, group_positions, period_accounts, lottery):
+        """批量校验候选账户组内账户总投注期数差异 - 期数极差超过阈值的组剔除
+        
+        该彩种无统计或组内有账户缺少统计时不校验，与逐组查表的判断一致。
+        """
+        total_periods_stats = self.account_total_periods_by_lottery.get(lottery)
+        if total_periods_stats is None or len(group_positions) == 0:
+            return group_positions
+        
+        # 按本期账户位置排成数组，缺少统计的账户记为-1
+        account_periods = np.array(
+            [total_periods_stats.get(account, -1) for account in period_accounts], dtype=np.int64
+        )
+        group_periods = account_periods[group_positions]
+        has_missing = (group_periods < 0).any(axis=1)
+        period_diffs = group_periods.max(axis=1) - group_periods.min(axis=1)
         
-        return True
+        return group_positions[has_missing | (period_diffs <= self.config.account_period_diff_threshold)]
     
     def find_continuous_patterns_optimized(self, wash_records):
         """连续对刷模式检测 - 修复过度过滤问题"""
         if not wash_records:
             return []
         
-        account_group_patterns = defaultdict(list)
-        
         # 简单的去重：确保同一期号、同一账户组、同一方向不会重复
+        # 排序后的账户组每条记录只算一次，去重键与分组键共用
         seen_keys = set()
         unique_records = []
+        record_group_keys = []
         
         for record in wash_records:
-            # 创建唯一标识键
+            sorted_accounts = tuple(sorted(record['账户组']))
             key = (
                 record['期号'],
-                tuple(sorted(record['账户组'])),
+                sorted_accounts,
                 tuple(sorted(record['方向组']))
             )
             
             if key not in seen_keys:
                 seen_keys.add(key)
                 unique_records.append(record)
+                record_group_keys.append((sorted_accounts, record['彩种']))
         
         # 使用去重后的记录进行分组
-        for record in unique_records:
-            # 不再过度过滤PK10序列位置检测
-            # 即使是普通协作，也允许显示
-            account_group_key = (tuple(sorted(record['账户组'])), record['彩种'])
-            account_group_patterns[account_group_key].append(record)
+        # 不再过度过滤PK10序列位置检测
+        # 即使是普通协作，也允许显示
+        # 账户组按首次出现顺序登记，保证输出顺序不变
+        account_group_patterns = {account_group_key: [] for account_group_key in record_group_keys}
+        
+        # 整体按期号稳定排序一次后分发，各组内记录天然有序，无需逐组排序
+        record_order = sorted(range(len(unique_records)), key=lambda i: unique_records[i]['期号'])
+        for i in record_order:
+            account_group_patterns[record_group_keys[i]].append(unique_records[i])
         
         continuous_patterns = []
         
         for account_group_key, records in account_group_patterns.items():
-            # 对每个组的记录按期号排序
-            sorted_records = sorted(records, key=lambda x: x['期号'])
+            sorted_records = records
             
             if isinstance(account_group_key, tuple) and len(account_group_key) > 0:
                 if isinstance(account_group_key[0], tuple):
@@ -2371,60 +2717,53 @@ class WashTradeDetector:
             else:
                 continue
             
+            # 组内各账户期数只查一次，活跃度与账户统计信息共用
+            total_periods_stats = self.account_total_periods_by_lottery.get(lottery, {})
+            group_periods = [total_periods_stats.get(account, 0) for account in account_group]
+            
+            # 活跃度每组只计算一次，最小期数要求由活跃度推出
+            activity_level = self.get_account_group_activity_level(account_group, lottery, group_periods)
+            
             # 根据检测类型设置不同的最小期数要求
-            if records and '检测类型' in records[0]:
-                if records[0]['检测类型'] == 'PK10序列位置':
-                    required_min_periods = 3  # PK10完整协作要求至少3期
-                else:
-                    required_min_periods = self.get_required_min_periods(account_group, lottery)
+            if records and records[0].get('检测类型') == 'PK10序列位置':
+                required_min_periods = 3  # PK10完整协作要求至少3期
             else:
-                required_min_periods = self.get_required_min_periods(account_group, lottery)
+                required_min_periods = self._get_min_periods_for_activity_level(activity_level)
             
             if len(sorted_records) >= required_min_periods:
-                # 确保详细记录也是唯一的（按期号去重）
+                # 确保详细记录也是唯一的（按期号去重），去重的同时一次遍历完成金额、相似度和类型统计
                 seen_periods = set()
                 unique_detailed_records = []
+                total_investment = 0
+                similarities = []
+                opposite_type_counts = Counter()
+                pattern_count = Counter()
                 
                 for record in sorted_records:
                     period = record['期号']
-                    if period not in seen_periods:
-                        seen_periods.add(period)
-                        unique_detailed_records.append(record)
+                    if period in seen_periods:
+                        continue
+                    
+                    seen_periods.add(period)
+                    unique_detailed_records.append(record)
+                    total_investment += record['总金额']
+                    if '相似度' in record:
+                        similarities.append(record['相似度'])
+                    opposite_type_counts[record.get('对立类型', '协作模式')] += 1
+                    pattern_count[record.get('模式', 'PK10协作')] += 1
                 
-                total_investment = sum(r['总金额'] for r in unique_detailed_records)
-                similarities = [r['相似度'] for r in unique_detailed_records if '相似度' in r]
+                # np.mean 为成对求和，保留以免平均相似度末位与以往报告不一致
                 avg_similarity = np.mean(similarities) if similarities else 1.0
                 
-                opposite_type_counts = defaultdict(int)
-                for record in unique_detailed_records:
-                    opposite_type = record.get('对立类型', '协作模式')
-                    opposite_type_counts[opposite_type] += 1
-                
-                pattern_count = defaultdict(int)
-                for record in unique_detailed_records:
-                    pattern = record.get('模式', 'PK10协作')
-                    pattern_count[pattern] += 1
-                
-                main_opposite_type = max(opposite_type_counts.items(), key=lambda x: x[1])[0] if opposite_type_counts else '协作模式'
-                
-                account_stats_info = []
-                for account in account_group:
-                    if hasattr(self, 'df_valid') and self.df_valid is not None:
-                        account_data = self.df_valid[
-                            (self.df_valid['会员账号'] == account) & 
-                            (self.df_valid['彩种'] == lottery)
-                        ]
-                        total_periods = account_data['期号'].nunique()
-                        records_count = len(account_data)
-                    else:
-                        total_periods_stats = self.account_total_periods_by_lottery.get(lottery, {})
-                        record_stats = self.account_record_stats_by_lottery.get(lottery, {})
-                        total_periods = total_periods_stats.get(account, 0)
-                        records_count = record_stats.get(account, 0)
-                    
-                    account_stats_info.append(f"{account}({total_periods}期/{records_count}记录)")
+                # most_common 与 max 一致：计数相同时取最先出现的类型
+                main_opposite_type = opposite_type_counts.most_common(1)[0][0] if opposite_type_counts else '协作模式'
                 
-                activity_level = self.get_account_group_activity_level(account_group, lottery)
+                # 账户统计与df_valid同源，直接查表
+                record_stats = self.account_record_stats_by_lottery.get(lottery, {})
+                account_stats_info = [
+                    f"{account}({total_periods}期/{record_stats.get(account, 0)}记录)"
+                    for account, total_periods in zip(account_group, group_periods)
+                ]
                 
                 continuous_pattern = {
                     '账户组': account_group,
@@ -2450,6 +2789,15 @@ class WashTradeDetector:
         
         return continuous_patterns
 
+    @staticmethod
+    def _iter_rows(df, columns):
+        """按列整体转为列表后逐行组合，替代iterrows；columns 为 [(列名, 缺失列默认值)]"""
+        column_values = [
+            df[column].tolist() if column in df.columns else [default] * len(df)
+            for column, default in columns
+        ]
+        return zip(*column_values)
+    
     def _detect_single_position_full_coverage(self, period_data, period, specific_lottery='PK10'):
         """增强版：检测单个位置全覆盖模式 - 支持单个位置单独下注和组合位置打包下注"""
         patterns = []
@@ -2465,13 +2813,9 @@ class WashTradeDetector:
             'position_details': defaultdict(list)
         })
         
-        for _, row in period_data.iterrows():
-            account = row['会员账号']
-            play_category = row.get('玩法分类', '')
-            content = row['内容']
-            amount = row.get('投注金额', 0)
-            direction = row.get('投注方向', '')
-            
+        for account, play_category, content, amount, direction in self._iter_rows(
+            period_data, [('会员账号', None), ('玩法分类', ''), ('内容', None), ('投注金额', 0), ('投注方向', '')]
+        ):
             if not direction:
                 direction = self.enhanced_extract_direction_with_position(content, play_category, 'PK10')
                 if not direction:
@@ -2712,13 +3056,9 @@ class WashTradeDetector:
             'position_amounts': {}
         })
         
-        for _, row in period_data.iterrows():
-            account = row['会员账号']
-            play_category = row.get('玩法分类', '')
-            content = row['内容']
-            amount = row.get('投注金额', 0)
-            direction = row.get('投注方向', '')
-            
+        for account, play_category, content, amount, direction in self._iter_rows(
+            period_data, [('会员账号', None), ('玩法分类', ''), ('内容', None), ('投注金额', 0), ('投注方向', '')]
+        ):
             if not direction:
                 direction = self.enhanced_extract_direction_with_position(content, play_category, 'PK10')
                 if not direction:
@@ -3009,12 +3349,9 @@ class WashTradeDetector:
         account_6_10_data = {}
         
         # 处理1-5名数据
-        for _, row in play_1_5.iterrows():
-            account = row['会员账号']
-            direction = row.get('投注方向', '')
-            amount = row.get('投注金额', 0)
-            content = row['内容']
-            
+        for account, direction, amount, content in self._iter_rows(
+            play_1_5, [('会员账号', None), ('投注方向', ''), ('投注金额', 0), ('内容', None)]
+        ):
             if direction:
                 account_1_5_data[account] = {
                     'direction': direction,
@@ -3024,12 +3361,9 @@ class WashTradeDetector:
                 }
         
         # 处理6-10名数据
-        for _, row in play_6_10.iterrows():
-            account = row['会员账号']
-            direction = row.get('投注方向', '')
-            amount = row.get('投注金额', 0)
-            content = row['内容']
-            
+        for account, direction, amount, content in self._iter_rows(
+            play_6_10, [('会员账号', None), ('投注方向', ''), ('投注金额', 0), ('内容', None)]
+        ):
             if direction:
                 account_6_10_data[account] = {
                     'direction': direction,
@@ -3100,14 +3434,10 @@ class WashTradeDetector:
         
         # 按账户分组
         account_bets = {}
-        for _, row in vertical_bets.iterrows():
-            account = row['会员账号']
-            content = row['内容']
-            direction = row.get('投注方向', '')
-            amount = row.get('投注金额', 0)
-            play_category = row.get('玩法分类', '')
-            original_play = row.get('玩法', '')  # 原始玩法字段
-            
+        # 原始玩法字段一并取出
+        for account, content, direction, amount, play_category, original_play in self._iter_rows(
+            vertical_bets, [('会员账号', None), ('内容', None), ('投注方向', ''), ('投注金额', 0), ('玩法分类', ''), ('玩法', '')]
+        ):
             if account not in account_bets:
                 account_bets[account] = []
             
@@ -3418,6 +3748,11 @@ class WashTradeDetector:
             lottery_total_periods = 0
             
             for detected_lottery in info['lotteries']:
+                lottery_stats = self._get_account_lottery_stats(account, detected_lottery)
+                if lottery_stats is not None:
+                    lottery_total_periods += lottery_stats[0]
+                    continue
+                
                 account_all_data = self.df_valid[self.df_valid['会员账号'] == account]
                 
                 if '原始彩种' in self.df_valid.columns:
@@ -3463,53 +3798,67 @@ class WashTradeDetector:
         pk10_positions = ['冠军', '亚军', '第三名', '第四名', '第五名', 
                          '第六名', '第七名', '第八名', '第九名', '第十名']
         
-        single_position_mask = df_valid['玩法分类'].isin(pk10_positions)
-        
-        single_position_data = df_valid[single_position_mask]
-        other_data = df_valid[~single_position_mask]
+        single_position_mask = df_valid['玩法分类'].isin(pk10_positions).to_numpy()
+        keep_other_mask = ~single_position_mask
         
-        if len(other_data) > 0:
-            if '投注方向' in other_data.columns:
-                multi_direction_mask = (
-                    other_data.groupby(['期号', '会员账号'])['投注方向']
-                    .transform('nunique') > 1
-                )
-                other_data_filtered = other_data[~multi_direction_mask]
-            else:
-                other_data_filtered = other_data
-        else:
-            other_data_filtered = other_data
+        if keep_other_mask.any() and '投注方向' in df_valid.columns:
+            # 单位置记录的方向置空后整表分组，nunique 只统计其余记录的方向，无需先切出子表
+            other_directions = df_valid['投注方向'].where(keep_other_mask)
+            multi_direction_mask = (
+                other_directions.groupby([df_valid['期号'], df_valid['会员账号']], sort=False, observed=True)
+                .transform('nunique') > 1
+            )
+            keep_other_mask &= ~multi_direction_mask.to_numpy()
         
-        df_filtered = pd.concat([single_position_data, other_data_filtered], ignore_index=True)
+        # 单位置记录在前、其余记录在后，只做一次取行
+        row_order = np.concatenate([np.flatnonzero(single_position_mask), np.flatnonzero(keep_other_mask)])
+        df_filtered = df_valid.take(row_order)
+        df_filtered.index = pd.RangeIndex(len(df_filtered))
         
         return df_filtered
     
-    def get_account_group_activity_level(self, account_group, lottery):
-        """获取活跃度水平"""
-        if hasattr(self, 'df_valid') and self.df_valid is not None:
-            min_total_periods = float('inf')
-            
-            for account in account_group:
-                account_data = self.df_valid[
-                    (self.df_valid['会员账号'] == account) & 
-                    (self.df_valid['彩种'] == lottery)
-                ]
-                periods = account_data['期号'].nunique()
-                if periods < min_total_periods:
-                    min_total_periods = periods
-            
-            if min_total_periods != float('inf'):
-                return self._calculate_activity_level(min_total_periods)
+    def _get_account_lottery_stats(self, account, lottery):
+        """账户在该彩种下的 (期数, 记录数) - 直接读取按彩种预先统计的结果
         
-        if lottery in self.account_total_periods_by_lottery:
-            total_periods_stats = self.account_total_periods_by_lottery[lottery]
-            
-            account_periods = [total_periods_stats.get(account, 0) for account in account_group]
-            if account_periods:
-                min_total_periods = min(account_periods)
-                return self._calculate_activity_level(min_total_periods)
+        统计与df_valid同源（原始彩种与彩种相同），命中时与逐行筛选结果一致；未命中返回None，由调用方回退模糊匹配
+        """
+        total_periods = self.account_total_periods_by_lottery.get(lottery, {}).get(account)
+        if total_periods is None:
+            return None
+        return total_periods, self.account_record_stats_by_lottery.get(lottery, {}).get(account, 0)
+    
+    def get_account_group_activity_level(self, account_group, lottery, group_periods=None):
+        """获取活跃度水平 - group_periods 为已查好的组内各账户期数时直接复用"""
+        # 同一账户组在不同检测（N账户、PK10序列）中会重复出现，按账户集合+彩种缓存
+        cache_key = (frozenset(account_group), lottery)
+        if cache_key in self.activity_level_cache:
+            return self.activity_level_cache[cache_key]
+        
+        min_total_periods = self._get_account_group_min_periods(account_group, lottery, group_periods)
+        
+        if min_total_periods is None:
+            activity_level = 'unknown'
+        else:
+            activity_level = self._calculate_activity_level(min_total_periods)
+        
+        self.activity_level_cache[cache_key] = activity_level
+        return activity_level
+    
+    def _get_account_group_min_periods(self, account_group, lottery, group_periods=None):
+        """账户组内最少的总投注期数 - 读取按彩种预先统计的期数，不再逐账户扫描df_valid"""
+        if not account_group:
+            return None
+        
+        has_valid_data = hasattr(self, 'df_valid') and self.df_valid is not None
+        if not has_valid_data and lottery not in self.account_total_periods_by_lottery:
+            return None
+        
+        if group_periods is None:
+            # 统计与df_valid同源，未出现的账户期数为0
+            total_periods_stats = self.account_total_periods_by_lottery.get(lottery, {})
+            group_periods = [total_periods_stats.get(account, 0) for account in account_group]
         
-        return 'unknown'
+        return min(group_periods)
     
     def _calculate_activity_level(self, min_total_periods):
         """根据期数计算活跃度水平"""
@@ -3522,10 +3871,8 @@ class WashTradeDetector:
         else:
             return 'very_high'
     
-    def get_required_min_periods(self, account_group, lottery):
-        """根据新的活跃度阈值获取所需的最小对刷期数"""
-        activity_level = self.get_account_group_activity_level(account_group, lottery)
-        
+    def _get_min_periods_for_activity_level(self, activity_level):
+        """活跃度水平对应的最小对刷期数"""
         if activity_level == 'low':
             return self.config.period_thresholds['min_periods_low']
         elif activity_level == 'medium':
@@ -3657,18 +4004,24 @@ class WashTradeDetector:
         # ========== 总体统计 ==========
         st.subheader("📊 总体统计")
         
-        # 修复彩种统计逻辑
+        # 一次遍历同时完成彩种统计、基础统计和按彩种分组
         lottery_stats = defaultdict(int)
+        patterns_by_lottery = defaultdict(list)
+        total_accounts = 0
+        total_wash_periods = 0
+        total_amount = 0
+        
         for pattern in patterns:
-            # 使用pattern中的'彩种'字段
-            lottery = pattern.get('彩种', '未知')
-            lottery_stats[lottery] += 1
+            # 修复彩种统计逻辑：使用pattern中的'彩种'字段
+            lottery_stats[pattern.get('彩种', '未知')] += 1
+            patterns_by_lottery[pattern['彩种']].append(pattern)
+            
+            total_accounts += pattern['账户数量']
+            total_wash_periods += pattern['对刷期数']
+            total_amount += pattern['总投注金额']
         
         # 计算基础统计
         total_groups = len(patterns)
-        total_accounts = sum(p['账户数量'] for p in patterns)
-        total_wash_periods = sum(p['对刷期数'] for p in patterns)
-        total_amount = sum(p['总投注金额'] for p in patterns)
         
         # 第一行：基础数据统计
         col1, col2, col3, col4 = st.columns(4)
@@ -3767,10 +4120,7 @@ class WashTradeDetector:
         # ========== 详细对刷组分析 ==========
         st.subheader("🔍 详细对刷组分析")
         
-        patterns_by_lottery = defaultdict(list)
-        for pattern in patterns:
-            lottery = pattern['彩种']
-            patterns_by_lottery[lottery].append(pattern)
+        account_stats_cache = {}
         
         for lottery, lottery_patterns in patterns_by_lottery.items():
             total_groups_in_lottery = len(lottery_patterns)
@@ -3787,14 +4137,22 @@ class WashTradeDetector:
             elif '3D' in lottery or '排列' in lottery:
                 lottery_icon = "🔢"
             
+            # 同一彩种下所有对刷组合并为一次st.markdown输出，减少前端消息数
             with st.expander(f"{lottery_icon} 彩种：{lottery}（发现{total_groups_in_lottery}组）", expanded=True):
-                for i, pattern in enumerate(lottery_patterns, 1):
-                    self._display_single_pattern_by_lottery(pattern, i, lottery)
+                st.markdown("\n\n".join(
+                    self._format_single_pattern_by_lottery(pattern, i, lottery, account_stats_cache)
+                    for i, pattern in enumerate(lottery_patterns, 1)
+                ))
     
-    def _display_single_pattern_by_lottery(self, pattern, index, lottery):
-        """按彩种显示单个对刷组详情 - 显示所有模式"""
+    def _format_single_pattern_by_lottery(self, pattern, index, lottery, account_stats_cache=None):
+        """按彩种生成单个对刷组详情的markdown - 显示所有模式
+        
+        account_stats_cache 缓存 (账户, 彩种) 的期数/记录数文本，同一账户在多个组中只扫描一次df_valid
+        """
         # 不再过滤任何模式，显示所有检测到的对刷组
-        st.markdown(f"**对刷组 {index}:** {' ↔ '.join(pattern['账户组'])}")
+        if account_stats_cache is None:
+            account_stats_cache = {}
+        markdown_lines = [f"**对刷组 {index}:** {' ↔ '.join(pattern['账户组'])}"]
         
         activity_icon = "🟢" if pattern['账户活跃度'] == 'low' else "🟡" if pattern['账户活跃度'] == 'medium' else "🟠" if pattern['账户活跃度'] == 'high' else "🔴"
         activity_text = {
@@ -3816,11 +4174,20 @@ class WashTradeDetector:
         else:
             display_type = main_type.split('(')[0] if '(' in main_type else main_type
         
-        st.markdown(f"**活跃度:** {activity_icon} {activity_text} | **彩种:** {lottery} | **主要类型:** {display_type}")
+        markdown_lines.append(f"**活跃度:** {activity_icon} {activity_text} | **彩种:** {lottery} | **主要类型:** {display_type}")
         
         account_stats_info = []
         for account in pattern['账户组']:
-            if hasattr(self, 'df_valid') and self.df_valid is not None:
+            cached_info = account_stats_cache.get((account, lottery))
+            if cached_info is not None:
+                account_stats_info.append(cached_info)
+                continue
+            
+            has_valid_data = hasattr(self, 'df_valid') and self.df_valid is not None
+            lottery_stats = self._get_account_lottery_stats(account, lottery) if has_valid_data else None
+            if lottery_stats is not None:
+                account_stats_info.append(f"{account}({lottery_stats[0]}期/{lottery_stats[1]}记录)")
+            elif has_valid_data:
                 account_all_data = self.df_valid[self.df_valid['会员账号'] == account]
                 
                 account_lottery_data = pd.DataFrame()
@@ -3847,18 +4214,19 @@ class WashTradeDetector:
                     account_stats_info.append(f"{account}({total_periods}期/{records_count}记录)")
             else:
                 account_stats_info.append(f"{account}(数据不可用)")
+            account_stats_cache[(account, lottery)] = account_stats_info[-1]
         
-        st.markdown(f"**账户在该彩种投注期数/总记录数:** {', '.join(account_stats_info)}")
+        markdown_lines.append(f"**账户在该彩种投注期数/总记录数:** {', '.join(account_stats_info)}")
         
-        st.markdown(f"**对刷期数:** {pattern['对刷期数']}期 (要求≥{pattern['要求最小对刷期数']}期)")
+        markdown_lines.append(f"**对刷期数:** {pattern['对刷期数']}期 (要求≥{pattern['要求最小对刷期数']}期)")
         
         detect_type = pattern.get('检测类型', '传统对刷')
         if detect_type == 'PK10序列位置':
-            st.markdown(f"**总金额:** {pattern['总投注金额']:.2f}元")
+            markdown_lines.append(f"**总金额:** {pattern['总投注金额']:.2f}元")
         else:
-            st.markdown(f"**总金额:** {pattern['总投注金额']:.2f}元 | **平均匹配:** {pattern['平均相似度']:.2%}")
+            markdown_lines.append(f"**总金额:** {pattern['总投注金额']:.2f}元 | **平均匹配:** {pattern['平均相似度']:.2%}")
         
-        st.markdown("**详细记录:**")
+        markdown_lines.append("**详细记录:**")
         
         # 确保详细记录不重复
         seen_periods = set()
@@ -3875,20 +4243,13 @@ class WashTradeDetector:
             # 获取位置详情
             play_categories = record.get('玩法分类', [])
             
-            account_directions = []
-            for idx, (account, direction, amount) in enumerate(zip(record['账户组'], record['方向组'], record['金额组'])):
-                if '-' in direction:
-                    clean_direction = direction.split('-', 1)[1]
-                else:
-                    clean_direction = direction
-                
-                # 显示位置详情
-                if idx < len(play_categories):
-                    position = play_categories[idx]
-                    # 不再添加额外的位置分配信息
-                    account_directions.append(f"{account}({position},{clean_direction}:¥{amount})")
-                else:
-                    account_directions.append(f"{account}({clean_direction}:¥{amount})")
+            # 方向去掉"-"前缀；有位置详情时一并显示，不再添加额外的位置分配信息
+            clean_directions = [direction.split('-', 1)[-1] for direction in record['方向组']]
+            directions_text = ' ↔ '.join([
+                f"{account}({play_categories[idx]},{direction}:¥{amount})" if idx < len(play_categories)
+                else f"{account}({direction}:¥{amount})"
+                for idx, (account, direction, amount) in enumerate(zip(record['账户组'], clean_directions, record['金额组']))
+            ])
             
             # 移除所有的位置分配和位置覆盖信息
             coverage_text = ""
@@ -3897,13 +4258,15 @@ class WashTradeDetector:
             # coverage_text = ""
             
             if detect_type == 'PK10序列位置':
-                st.write(f"{record_count}. 期号: {record['期号']} | 方向: {' ↔ '.join(account_directions)}")
+                markdown_lines.append(f"{record_count}. 期号: {record['期号']} | 方向: {directions_text}")
             else:
                 similarity_display = f"{record['相似度']:.2%}" if '相似度' in record else "100.00%"
-                st.write(f"{record_count}. 期号: {record['期号']} | 方向: {' ↔ '.join(account_directions)} | 匹配度: {similarity_display}")
+                markdown_lines.append(f"{record_count}. 期号: {record['期号']} | 方向: {directions_text} | 匹配度: {similarity_display}")
         
         if index < len(pattern):
-            st.markdown("---")
+            markdown_lines.append("---")
+        
+        return "\n\n".join(markdown_lines)
 
     def display_summary_statistics(self, patterns):
         """显示总体统计"""
@@ -4027,93 +4390,168 @@ class WashTradeDetector:
             return None
         
         try:
-            main_data = []
-            detailed_data = []
+            # 按列收集数据，DataFrame每列只分配一次
+            main_data = {column: [] for column in [
+                '组ID', '账户组', '彩种', '彩种类型', '账户数量', '主要对立类型', '对刷期数',
+                '要求最小对刷期数', '总投注金额', '平均相似度', '账户活跃度', '账户统计信息'
+            ]}
+            detailed_data = {column: [] for column in [
+                '组ID', '账户组', '期号', '彩种', '彩种类型', '方向组', '金额组',
+                '总金额', '相似度', '账户数量', '模式', '对立类型'
+            ]}
             
             for i, pattern in enumerate(patterns, 1):
-                main_record = {
-                    '组ID': f"组{i}",
-                    '账户组': ' ↔ '.join(pattern['账户组']),
-                    '彩种': pattern['彩种'],
-                    '彩种类型': pattern['彩种类型'],
-                    '账户数量': pattern['账户数量'],
-                    '主要对立类型': pattern['主要对立类型'],
-                    '对刷期数': pattern['对刷期数'],
-                    '要求最小对刷期数': pattern['要求最小对刷期数'],
-                    '总投注金额': pattern['总投注金额'],
-                    '平均相似度': pattern['平均相似度'],
-                    '账户活跃度': pattern['账户活跃度'],
-                    '账户统计信息': '; '.join(pattern['账户统计信息'])
-                }
-                main_data.append(main_record)
+                # 组级字段每组只格式化一次，详细记录直接复用
+                group_id = f"组{i}"
+                group_accounts = ' ↔ '.join(pattern['账户组'])
                 
-                for j, record in enumerate(pattern['详细记录'], 1):
-                    detailed_record = {
-                        '组ID': f"组{i}",
-                        '账户组': ' ↔ '.join(pattern['账户组']),
-                        '期号': record['期号'],
-                        '彩种': record['彩种'],
-                        '彩种类型': record['彩种类型'],
-                        '方向组': ' ↔ '.join([f"{acc}({dir})" for acc, dir in zip(record['账户组'], record['方向组'])]),
-                        '金额组': ' ↔ '.join([f"¥{amt}" for amt in record['金额组']]),
-                        '总金额': record['总金额'],
-                        '相似度': record['相似度'],
-                        '账户数量': record['账户数量'],
-                        '模式': record['模式'],
-                        '对立类型': record['对立类型']
-                    }
-                    detailed_data.append(detailed_record)
-            
-            df_main = pd.DataFrame(main_data)
-            df_detailed = pd.DataFrame(detailed_data)
-            
-            numeric_columns = ['总投注金额', '平均相似度', '总金额', '相似度']
-            for col in numeric_columns:
-                if col in df_main.columns:
-                    df_main[col] = df_main[col].apply(lambda x: f"¥{x:,.2f}" if '金额' in col else f"{x:.2%}")
-                if col in df_detailed.columns:
-                    df_detailed[col] = df_detailed[col].apply(lambda x: f"¥{x:,.2f}" if '金额' in col else f"{x:.2%}")
+                main_data['组ID'].append(group_id)
+                main_data['账户组'].append(group_accounts)
+                main_data['彩种'].append(pattern['彩种'])
+                main_data['彩种类型'].append(pattern['彩种类型'])
+                main_data['账户数量'].append(pattern['账户数量'])
+                main_data['主要对立类型'].append(pattern['主要对立类型'])
+                main_data['对刷期数'].append(pattern['对刷期数'])
+                main_data['要求最小对刷期数'].append(pattern['要求最小对刷期数'])
+                main_data['总投注金额'].append(pattern['总投注金额'])
+                main_data['平均相似度'].append(pattern['平均相似度'])
+                main_data['账户活跃度'].append(pattern['账户活跃度'])
+                main_data['账户统计信息'].append('; '.join(pattern['账户统计信息']))
+                
+                for record in pattern['详细记录']:
+                    detailed_data['组ID'].append(group_id)
+                    detailed_data['账户组'].append(group_accounts)
+                    detailed_data['期号'].append(record['期号'])
+                    detailed_data['彩种'].append(record['彩种'])
+                    detailed_data['彩种类型'].append(record['彩种类型'])
+                    detailed_data['方向组'].append(' ↔ '.join([f"{acc}({dir})" for acc, dir in zip(record['账户组'], record['方向组'])]))
+                    detailed_data['金额组'].append(' ↔ '.join([f"¥{amt}" for amt in record['金额组']]))
+                    detailed_data['总金额'].append(record['总金额'])
+                    detailed_data['相似度'].append(record['相似度'])
+                    detailed_data['账户数量'].append(record['账户数量'])
+                    detailed_data['模式'].append(record['模式'])
+                    detailed_data['对立类型'].append(record['对立类型'])
             
             if export_format == 'excel':
-                return self._export_to_excel(df_main, df_detailed)
+                return self._export_to_excel(main_data, detailed_data)
             else:
-                return self._export_to_csv(df_main, df_detailed)
+                return self._export_to_csv(
+                    pd.DataFrame(self._format_export_values(main_data)),
+                    pd.DataFrame(self._format_export_values(detailed_data))
+                )
                 
         except Exception as e:
             logger.error(f"导出失败: {str(e)}")
             st.error(f"导出失败: {str(e)}")
             return None
 
-    def _export_to_excel(self, df_main, df_detailed):
-        """导出到Excel格式"""
+    def _export_to_excel(self, main_data, detailed_data):
+        """导出到Excel格式 - 优先使用xlsxwriter，不可用或失败时回退openpyxl"""
+        if EXCEL_WRITE_ENGINE == 'xlsxwriter':
+            try:
+                return self._export_to_excel_xlsxwriter(main_data, detailed_data)
+            except Exception as e:
+                logger.warning(f"xlsxwriter导出失败，回退openpyxl: {str(e)}")
+        
+        return self._export_to_excel_openpyxl(main_data, detailed_data)
+    
+    def _excel_report_titles(self, group_count):
+        """汇总表顶部的三行标题"""
+        return [
+            "对刷检测结果报告",
+            f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            f"总对刷组数: {group_count}"
+        ]
+    
+    @staticmethod
+    def _format_export_values(columns):
+        """数值列转成显示文本（取值重复度高，同值只格式化一次）"""
+        formatted = dict(columns)
+        for column, (_, display_format) in EXPORT_VALUE_FORMATS.items():
+            if column not in columns:
+                continue
+            text_cache = {}
+            formatted[column] = [
+                text_cache[value] if value in text_cache else text_cache.setdefault(value, display_format.format(value))
+                for value in columns[column]
+            ]
+        return formatted
+    
+    @staticmethod
+    def _excel_column_widths(columns):
+        """按表头和单元格显示内容计算列宽（最长内容+2，上限50）"""
+        widths = []
+        for column, values in columns.items():
+            if column in EXPORT_VALUE_FORMATS and values:
+                # 数值列按显示文本计算，最长文本出现在最小/最大值处
+                display_format = EXPORT_VALUE_FORMATS[column][1]
+                lengths = [len(display_format.format(value)) for value in (min(values), max(values))]
+            else:
+                lengths = [len(str(value)) for value in values]
+            max_length = max([len(str(column))] + lengths)
+            widths.append(min(max_length + 2, 50))
+        return widths
+    
+    def _export_to_excel_xlsxwriter(self, main_data, detailed_data):
+        """使用xlsxwriter导出Excel - constant_memory模式，不经DataFrame按行流式写出"""
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False
+        })
+        title_format = workbook.add_format({'bold': True, 'font_size': 12, 'align': 'center'})
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        
+        # constant_memory模式只保留当前行，必须严格按行顺序写入：先标题行，再表头和数据
+        main_sheet = workbook.add_worksheet('对刷组汇总')
+        for row, title in enumerate(self._excel_report_titles(len(main_data['组ID']))):
+            main_sheet.merge_range(row, 0, row, 11, title, title_format)
+        detailed_sheet = workbook.add_worksheet('详细记录')
+        
+        # 数字格式对象全表共用；列宽和列格式须在写数据行之前设置
+        number_formats = {
+            column: workbook.add_format({'num_format': num_format})
+            for column, (num_format, _) in EXPORT_VALUE_FORMATS.items()
+        }
+        
+        for sheet, columns, start_row in [(main_sheet, main_data, 3), (detailed_sheet, detailed_data, 0)]:
+            for col_idx, (column, width) in enumerate(zip(columns, self._excel_column_widths(columns))):
+                sheet.set_column(col_idx, col_idx, width, number_formats.get(column))
+            
+            sheet.write_row(start_row, 0, list(columns), header_format)
+            for row_idx, row in enumerate(zip(*columns.values()), start_row + 1):
+                sheet.write_row(row_idx, 0, row)
+        
+        workbook.close()
+        output.seek(0)
+        return output
+    
+    def _export_to_excel_openpyxl(self, main_data, detailed_data):
+        """使用openpyxl导出Excel"""
         try:
             output = io.BytesIO()
             
             with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_main.to_excel(writer, sheet_name='对刷组汇总', index=False)
-                df_detailed.to_excel(writer, sheet_name='详细记录', index=False)
+                pd.DataFrame(main_data).to_excel(writer, sheet_name='对刷组汇总', index=False)
+                pd.DataFrame(detailed_data).to_excel(writer, sheet_name='详细记录', index=False)
                 
                 workbook = writer.book
                 main_sheet = workbook['对刷组汇总']
                 detailed_sheet = workbook['详细记录']
                 
-                for sheet in [main_sheet, detailed_sheet]:
-                    for column in sheet.columns:
-                        max_length = 0
-                        column_letter = column[0].column_letter
-                        for cell in column:
-                            try:
-                                if len(str(cell.value)) > max_length:
-                                    max_length = len(str(cell.value))
-                            except:
-                                pass
-                        adjusted_width = min(max_length + 2, 50)
-                        sheet.column_dimensions[column_letter].width = adjusted_width
+                for sheet, columns in [(main_sheet, main_data), (detailed_sheet, detailed_data)]:
+                    for col_idx, (column, width) in enumerate(zip(columns, self._excel_column_widths(columns)), 1):
+                        column_letter = openpyxl.utils.get_column_letter(col_idx)
+                        sheet.column_dimensions[column_letter].width = width
+                        
+                        if column in EXPORT_VALUE_FORMATS:
+                            num_format = EXPORT_VALUE_FORMATS[column][0]
+                            for (cell,) in sheet.iter_rows(min_row=2, min_col=col_idx, max_col=col_idx):
+                                cell.number_format = num_format
                 
                 main_sheet.insert_rows(0, 3)
-                main_sheet['A1'] = "对刷检测结果报告"
-                main_sheet['A2'] = f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                main_sheet['A3'] = f"总对刷组数: {len(df_main)}"
+                main_sheet['A1'], main_sheet['A2'], main_sheet['A3'] = self._excel_report_titles(len(main_data['组ID']))
                 
                 main_sheet.merge_cells('A1:L1')
                 main_sheet.merge_cells('A2:L2')
@@ -4164,6 +4602,17 @@ class WashTradeDetector:
             logger.error(f"CSV导出失败: {str(e)}")
             raise e
 
+    def export_detection_bytes(self, patterns, export_format='excel'):
+        """导出检测结果为bytes - 缓冲区已截到实际大小，getvalue直接交出内部字节不再复制"""
+        output = self.export_detection_results(patterns, export_format)
+        return output.getvalue() if output is not None else None
+    
+    def _get_export_data(self, patterns, export_format):
+        """获取导出文件，主流程设置了report_key时走缓存"""
+        if self.report_key is not None:
+            return build_cached_export(self.report_key, export_format, self, patterns)
+        return self.export_detection_bytes(patterns, export_format)
+    
     def display_export_buttons(self, patterns):
         """显示导出按钮"""
         if not patterns:
@@ -4172,12 +4621,20 @@ class WashTradeDetector:
         st.markdown("---")
         st.subheader("📤 导出检测结果")
         
+        detail_count = sum(len(p['详细记录']) for p in patterns)
+        # 详细记录表另有1行表头
+        excel_too_large = detail_count + 1 > self.config.excel_max_rows
+        if excel_too_large:
+            st.warning(f"⚠️ 详细记录共{detail_count}条，超过Excel单表行数上限，请使用CSV导出")
+        elif detail_count >= self.config.large_export_rows:
+            st.info("💡 详细记录较多，CSV导出速度更快、文件更小")
+        
         col1, col2 = st.columns(2)
         
         with col1:
-            if st.button("📊 导出Excel报告", use_container_width=True):
+            if st.button("📊 导出Excel报告", use_container_width=True, disabled=excel_too_large):
                 with st.spinner("正在生成Excel报告..."):
-                    excel_data = self.export_detection_results(patterns, 'excel')
+                    excel_data = self._get_export_data(patterns, 'excel')
                     if excel_data:
                         st.download_button(
                             label="⬇️ 下载Excel文件",
@@ -4190,7 +4647,7 @@ class WashTradeDetector:
         with col2:
             if st.button("📄 导出CSV文件", use_container_width=True):
                 with st.spinner("正在生成CSV文件..."):
-                    csv_data = self.export_detection_results(patterns, 'csv')
+                    csv_data = self._get_export_data(patterns, 'csv')
                     if csv_data:
                         st.download_button(
                             label="⬇️ 下载CSV压缩包",
@@ -4200,7 +4657,59 @@ class WashTradeDetector:
                             use_container_width=True
                         )
         
-        st.info(f"📊 导出内容: {len(patterns)}个对刷组, 共{sum(len(p['详细记录']) for p in patterns)}条详细记录")
+        st.info(f"📊 导出内容: {len(patterns)}个对刷组, 共{detail_count}条详细记录")
+
+# ==================== 缓存的检测入口 ====================
+def build_detection_config(detection_params):
+    """根据侧边栏参数构建检测配置"""
+    params = dict(detection_params)
+    config = Config()
+    config.min_amount = params['min_amount']
+    config.max_accounts_in_group = params['max_accounts']
+    config.account_period_diff_threshold = params['period_diff_threshold']
+    
+    similarity_2, similarity_3, similarity_4, similarity_5 = params['similarity_thresholds']
+    config.amount_similarity_threshold = similarity_2
+    
+    config.amount_threshold = {
+        'max_amount_ratio': params['max_ratio'],
+        'enable_threshold_filter': params['enable_balance_filter']
+    }
+    
+    config.account_count_similarity_thresholds = {
+        2: similarity_2,
+        3: similarity_3,
+        4: similarity_4,
+        5: similarity_5
+    }
+    
+    min_periods_low, min_periods_medium, min_periods_high, min_periods_very_high = params['min_periods']
+    config.period_thresholds.update({
+        'min_periods_low': min_periods_low,
+        'min_periods_medium': min_periods_medium,
+        'min_periods_high': min_periods_high,
+        'min_periods_very_high': min_periods_very_high
+    })
+    return config
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def run_wash_trade_detection(file_bytes, file_name, detection_params):
+    """解析并检测上传文件 - 文件内容和参数不变时直接复用上次的检测结果"""
+    detector = WashTradeDetector(build_detection_config(detection_params))
+    
+    uploaded_file = io.BytesIO(file_bytes)
+    uploaded_file.name = file_name
+    df_enhanced, _ = detector.upload_and_process(uploaded_file)
+    if df_enhanced is None or len(df_enhanced) == 0:
+        return None, None
+    
+    patterns = detector.detect_all_wash_trades()
+    return detector, patterns
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_cached_export(report_key, export_format, _detector, _patterns):
+    """生成导出文件 - 同一文件和参数的检测结果只序列化一次"""
+    return _detector.export_detection_bytes(_patterns, export_format)
 
 # ==================== 主函数 ====================
 def main():
@@ -4313,56 +4822,44 @@ def main():
             min_value=8, max_value=30, value=11,
             help="总投注期数100期以上的账户，要求的最小连续对刷期数"
         )
+        
+        show_debug_info = st.checkbox("显示调试信息", value=False,
+                                      help="程序出错时显示完整的异常堆栈")
     
     if uploaded_file is not None:
         try:
-            config = Config()
-            config.min_amount = min_amount
-            config.max_accounts_in_group = max_accounts
-            config.account_period_diff_threshold = period_diff_threshold
-            
-            config.amount_similarity_threshold = similarity_2_accounts
-            
-            config.amount_threshold = {
-                'max_amount_ratio': max_ratio,
-                'enable_threshold_filter': enable_balance_filter
-            }
-            
-            config.account_count_similarity_thresholds = {
-                2: similarity_2_accounts,
-                3: similarity_3_accounts,
-                4: similarity_4_accounts,
-                5: similarity_5_accounts
-            }
-            
-            config.period_thresholds.update({
-                'min_periods_low': min_periods_low,
-                'min_periods_medium': min_periods_medium,
-                'min_periods_high': min_periods_high,
-                'min_periods_very_high': min_periods_very_high
-            })
-            
-            detector = WashTradeDetector(config)
+            detection_params = (
+                ('min_amount', min_amount),
+                ('max_accounts', max_accounts),
+                ('period_diff_threshold', period_diff_threshold),
+                ('enable_balance_filter', enable_balance_filter),
+                ('max_ratio', max_ratio),
+                ('similarity_thresholds', (similarity_2_accounts, similarity_3_accounts,
+                                           similarity_4_accounts, similarity_5_accounts)),
+                ('min_periods', (min_periods_low, min_periods_medium,
+                                 min_periods_high, min_periods_very_high))
+            )
+            file_bytes = uploaded_file.getvalue()
             
             st.success(f"✅ 已上传文件: {uploaded_file.name}")
             
-            with st.spinner("🔄 正在解析数据..."):
-                df_enhanced, filename = detector.upload_and_process(uploaded_file)
-                
-                if df_enhanced is not None and len(df_enhanced) > 0:
-                    with st.spinner("🔍 正在检测对刷交易..."):
-                        patterns = detector.detect_all_wash_trades()
-                    
-                    if patterns:
-                        detector.display_detailed_results(patterns)
-                        detector.display_export_buttons(patterns)
-                    else:
-                        st.warning("⚠️ 未发现符合阈值条件的对刷行为")
-                else:
-                    st.error("❌ 数据解析失败，请检查文件格式和内容")
+            with st.spinner("🔄 正在解析数据并检测对刷交易..."):
+                detector, patterns = run_wash_trade_detection(file_bytes, uploaded_file.name, detection_params)
+            
+            if detector is None:
+                st.error("❌ 数据解析失败，请检查文件格式和内容")
+            elif patterns:
+                detector.report_key = (hashlib.md5(file_bytes).hexdigest(), uploaded_file.name, detection_params)
+                detector.display_detailed_results(patterns)
+                detector.display_export_buttons(patterns)
+            else:
+                st.warning("⚠️ 未发现符合阈值条件的对刷行为")
             
         except Exception as e:
             st.error(f"❌ 程序执行失败: {str(e)}")
+            # 完整堆栈只在调试模式下格式化和展示
+            if show_debug_info:
+                st.code(traceback.format_exc())
     else:
         st.info("👈 请在左侧边栏上传数据文件开始分析")
         